@@ -8,7 +8,9 @@ Created on Fri Jun 12 15:50:11 2020
 
 from __future__ import division, unicode_literals # absolute_import(utils)
 
-from io import StringIO, TextIOBase
+import re
+
+from io import BufferedIOBase, BytesIO, StringIO, TextIOBase
 
 
 ### helper classes ###
@@ -17,8 +19,20 @@ from io import StringIO, TextIOBase
 class StreamReader:
     r"""simple prototxt stream splitter"""
 
-    def __init__(self, stream:TextIOBase):
+    SCAN_REGEX :'re.Pattern' = re.compile(r'[{}"\'#\n]')
+    SCAN_REGEX_BINARY :'re.Pattern' = re.compile(SCAN_REGEX.pattern.encode())
+    SCAN_TOKENS :'Tuple[str, ...]' = tuple('\n"\'#{}')
+    SCAN_TOKENS_BINARY :'Tuple[bytes, ...]' = tuple(t.encode() for t in SCAN_TOKENS)
+    QUOTE_END_REGEX :'Mapping[AnyStr, re.Pattern]' = { # skips escapes up to the closing quote
+        '"' : re.compile(r'(?:[^"\\]|\\.)*"', re.DOTALL),
+        "'" : re.compile(r"(?:[^'\\]|\\.)*'", re.DOTALL),
+        b'"': re.compile(rb'(?:[^"\\]|\\.)*"', re.DOTALL),
+        b"'": re.compile(rb"(?:[^'\\]|\\.)*'", re.DOTALL),
+    }
+
+    def __init__(self, stream:'Union[TextIOBase, BufferedIOBase]'):
         self.stream = stream
+        self.pending = [] # split binary lines, reversed
 
     def __iter__(self)->'Iterator':
         while True:
@@ -28,99 +42,93 @@ class StreamReader:
 
             yield data
 
-    def read_one(self)->str:
-        r"""read one parsible field / block"""
-
-        self.buf = StringIO()
-        self.states = []
+    def readline(self)->'Union[str, bytes]':
+        r"""readline, with universal newlines as text mode for binary lines, bare \r included"""
+
+        pending = self.pending
+        if pending:
+            return pending.pop()
+
+        line = self.stream.readline()
+        if isinstance(line, bytes) and b'\r' in line:
+            pending[:] = line.replace(b'\r\n', b'\n').replace(b'\r', b'\n').splitlines(True)
+            pending.reverse()
+            line = pending.pop()
+        return line
+
+    def read_one(self)->'Union[str, bytes]':
+        r"""read one parsible field / block, of the same type as the stream lines"""
+
+        lines = [] # scanned line by line, joined once the block ends
+        pos = 0 # offset in the current line
+        depth = 0
+        quote = None # matches the rest of the quoted string while in one
+        commented = False
+        readline = self.readline
         while True:
-            line = self.stream.readline()
+            line = readline()
             if not line:
                 break
 
-            if not self.states and line.strip():
-                self.states.append((self._read_block, dict()))
-
-            pos = self.buf.tell()
-            self.buf.write(line)
-            self.buf.seek(pos)
-            sub_state = None
-            while self.states:
-                func, state = self.states.pop()
-                sub_state = func(sub_state, **state)
-                if sub_state is None:
+            if not lines:
+                # HINT: binary streams are scanned as is, with bytes tokens
+                if isinstance(line, bytes):
+                    search = StreamReader.SCAN_REGEX_BINARY.search
+                    tokens = StreamReader.SCAN_TOKENS_BINARY
+                else:
+                    search = StreamReader.SCAN_REGEX.search
+                    tokens = StreamReader.SCAN_TOKENS
+                newline, dquote, squote, comment, lbrace, rbrace = tokens
+                if not line.strip():
+                    return newline
+
+            lines.append(line)
+            if commented:
+                pos = line.find(newline)
+                if pos < 0:
+                    pos = 0
+                    continue
+
+                commented = False
+
+            while True:
+                if quote:
+                    m = quote(line, pos)
+                    if not m: # continued in the next line
+                        pos = 0
+                        break
+
+                    pos = m.end()
+                    quote = None
+
+                m = search(line, pos)
+                if not m:
+                    pos = 0
                     break
-            else:
-                size = self.buf.tell()
-                self.buf.seek(0)
-                ret = self.buf.read(size)
-                self.buf = StringIO()
-                if not (sub_state and sub_state.get('newline')):
-                    ret += '\n'
-                return ret
-
-        if self.states:
-            raise IOError('stream closed with trailing content')
-
-    def _read_block(
-            self, sub_state,
-            depth=0):
-        if sub_state and sub_state.get('newline'):
-            self.buf.seek(self.buf.tell() - 1)
-
-        get_state = lambda: {'depth': depth}
 
-        while True:
-            char = self.buf.read(1)
-            if not char:
-                break
-
-            if char == '"' or char == "'":
-                self.states.append((self._read_block, get_state()))
-                self.states.append((self._read_quoted_string, {'quote': char}))
-                return Ellipsis
-            elif char == '#':
-                self.states.append((self._read_block, get_state()))
-                self.states.append((self._read_comment, dict()))
-                return Ellipsis
-            elif char == '\n':
-                if depth == 0:
-                    return {'newline': True}
-            elif char == '{':
-                depth += 1
-            elif char == '}':
-                if depth == 0:
-                    raise ValueError('unexpected }')
-
-                depth -= 1
-
-        self.states.append((self._read_block, get_state()))
-
-    def _read_quoted_string(
-            self, sub_state,
-            quote='"', escaped=False):
-        while True:
-            char = self.buf.read(1)
-            if not char:
-                break
-
-            if escaped:
-                escaped = False
-                continue
-
-            if char == '\\':
-                escaped = True
-            elif char == quote:
-                return dict()
-
-        self.states.append((self._read_quoted_string, {'quote': quote, 'escaped': escaped}))
-
-    def _read_comment(self, sub_state):
-        line = self.buf.readline()
-        if line.endswith('\n'):
-            return {'newline': True}
-
-        self.states.append((self._read_comment, dict()))
+                char = m.group()
+                pos = m.end()
+                if char == dquote or char == squote:
+                    quote = StreamReader.QUOTE_END_REGEX[char].match
+                elif char == comment:
+                    pos = line.find(newline, pos)
+                    if pos < 0:
+                        pos = 0
+                        commented = True
+                        break
+                elif char == newline:
+                    if depth == 0:
+                        return newline[:0].join(lines)
+                elif char == lbrace:
+                    depth += 1
+                elif char == rbrace:
+                    if depth == 0:
+                        raise ValueError('unexpected }')
+
+                    depth -= 1
+
+        if lines:
+            raise IOError('stream closed with trailing content')
 
 
 if __name__ == '__main__':
@@ -142,3 +150,8 @@ if __name__ == '__main__':
     for b in s:
         print(b.rstrip('\n'))
         print('-' * 9)
+
+    for text in (b'a: 1\rb {\r  x: 2\r}\r', b'a: 1\r\nb {\r\n  x: 2\r\n}\r\n'): # CR-only, CRLF
+        s = list(StreamReader(BytesIO(text)))
+        print(s)
+        assert s == [b'a: 1\n', b'b {\n  x: 2\n}\n']
@@ -13,7 +13,11 @@ import yaml
 
 from pb_utils import StreamReader
 from quick_prototxt import dump_prototxt, load_prototxt
-from ypath import YPath
+from ypath import compile as compile_ypath
+
+
+CACHE_SIZE         :int = 1024
+STREAM_BUFFER_SIZE :int = 1 << 20
 
 
 def main():
@@ -54,6 +58,11 @@ YPath syntax:
         '--delimiter', '-t', type=str, nargs='?', default='---', const='',
         help='delimiter between occurance',
     )
+    parser.add_argument(
+        '--no-cache', action='store_true',
+        help=('disable caching of repeated blocks, '
+              f'by default up to {CACHE_SIZE} parsed blocks are kept in memory'),
+    )
     parser.add_argument(
         '--debug', '-d', action='store_true',
         help='enable debug logging',
@@ -65,19 +74,40 @@ YPath syntax:
     logging.basicConfig(format=logging_format, level=logging_level)
     logger = logging.getLogger(name='main')
 
-    path = YPath()
-    stream = StreamReader(sys.stdin if args.file is None else open(args.file))
+    # flushed once per block, so no line buffering is required
+    sys.stdout.reconfigure(line_buffering=False, write_through=False)
+
+    # HINT: split in binary, only the emitted blocks are decoded
+    stream = StreamReader(sys.stdin.buffer if args.file is None
+                          else open(args.file, 'rb', buffering=STREAM_BUFFER_SIZE))
     delimiter = args.delimiter
 
     if delimiter and not delimiter.endswith('\n'):
         delimiter += '\n'
 
+    cached = not args.no_cache
+    if cached:
+        # HINT: loaded roots are shared between repeated blocks, YPath filtering is read-only
+        # both caches are LRU: hits are moved to the end, the first entry is the oldest
+        loaded = dict()
+        dumped = dict()
+
+        def cached_dump(o):
+            key = repr(o)
+            ret = dumped.pop(key, None)
+            if ret is None:
+                if len(dumped) >= CACHE_SIZE:
+                    del dumped[next(iter(dumped))]
+                ret = dump_prototxt(o)
+            dumped[key] = ret
+            return ret
+
     timings = {
         'parsing YPath': [None, None],
     }
     key = 'parsing YPath'
     timings[key][0] = time.time()
-    path.parse(args.path.strip())
+    path = compile_ypath(args.path.strip())
     timings[key][1] = time.time()
     logger.debug('path:\n\t%s', path)
     for key, (t0, t1) in timings.items():
@@ -93,18 +123,12 @@ YPath syntax:
     }
 
     def _add_measurement(key):
-        if not args.debug:
-            return
-
         tn, tl = time.time(), timings['last']
         timings['last'] = tn
         timings[key][0] += tn - tl
         timings[key][1] += 1
 
     def _report_timings():
-        if not args.debug:
-            return
-
         tp = time.time()
         if tp - timings['print'] > 2:  # every 2 seconds
             timings['print'] = tp
@@ -117,33 +141,52 @@ YPath syntax:
             logger.debug('timing ' + delimiter.rstrip())
         timings['last'] = time.time()
 
+    # HINT: bound once, no instrumentation in the loop unless debugging
+    if args.debug:
+        _measure, _report = _add_measurement, _report_timings
+    else:
+        _measure = _report = lambda *_: None
+
     timings['print'] = timings['last'] = time.time()
     for block in stream:
-        _add_measurement('split prototxt')
+        _measure('split prototxt')
 
+        text = block.decode('utf-8')
         try:
-            root = load_prototxt(block)
+            if cached and text in loaded: # repeated block, repeated results
+                root = loaded[text] = loaded.pop(text)
+                dump = cached_dump
+            else:
+                root = load_prototxt(text)
+                dump = dump_prototxt
+                if cached:
+                    if len(loaded) >= CACHE_SIZE:
+                        del loaded[next(iter(loaded))]
+                    loaded[text] = root
         except yaml.parser.ParserError:
             continue
         else:
-            _add_measurement('parsing prototxt')
+            _measure('parsing prototxt')
 
             if root is None or not isinstance(root, dict): # shortcut
                 continue
 
             results = path.collect(root, with_name=True)
 
-            _add_measurement('filter YPath')
+            _measure('filter YPath')
 
+            chunks = []
             for result in results:
-                sys.stdout.write(dump_prototxt(result))
-                sys.stdout.write(delimiter)
+                chunks.append(dump(result))
+                chunks.append(delimiter)
+            if chunks:
+                sys.stdout.write(''.join(chunks))
 
-            _add_measurement('serialize prototxt')
+            _measure('serialize prototxt')
 
             sys.stdout.flush()
 
-            _report_timings()
+            _report()
 
 
 if __name__ == '__main__':
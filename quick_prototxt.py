@@ -11,16 +11,37 @@ from __future__ import absolute_import, division, unicode_literals
 import logging, re
 import yaml
 
-from io import StringIO
+from functools import lru_cache
 
 
 DELIMITER             :str = '@'
 UNAME_ID_FORMAT       :str = '{:09d}'
+STR_TAG               :str = '!str '
+LIST_CLSS             :'Tuple[type, ...]' = (list, tuple, set)
+YAML_RESERVED_KEYS    :'FrozenSet[str]' = frozenset( # field names resolved as bool / None by YAML 1.1
+    case(word)
+    for word in ('yes', 'no', 'true', 'false', 'on', 'off', 'null')
+    for case in (str.lower, str.title, str.upper))
 
 CYAML_WARNING_MESSAGE :str = (
     'cYAML not enabled, using pyYAML implementation may impact performance'
 )
 
+REGEX_SCALAR          :'re.Pattern' = re.compile(r'[a-zA-Z]\w*\s*[{:]')
+REGEX_FLOW_REWRITE    :'re.Pattern' = re.compile(
+    r'(?P<brace>(?<=\w)\s*{(?=\s*\n))|' # field brace, may follow line breaks
+    r'(?P<line_end>\s*\n)(?P<indent>\s*)' # line end with trailing spaces and empty lines
+    r'(?:(?P<key>[a-zA-Z]\w*)(?P<key_end>\s*:|\s*{(?=\s*\n)))?') # leading key
+REGEX_INF             :'re.Pattern' = re.compile(r'-?inf(?:inity)?f?', re.IGNORECASE)
+REGEX_NAN             :'re.Pattern' = re.compile(r'nanf?', re.IGNORECASE)
+REGEX_NUMERIC_HEAD    :'re.Pattern' = re.compile(r'\s*[\-\+\.\dIiNn]') # may be accepted by float
+REGEX_UNAME_KEY       :'re.Pattern' = re.compile(
+    r'(\n\s*)([a-zA-Z]\w*)' + re.escape(DELIMITER) + r'\d+\s*:')
+REGEX_MAPPING_LINE    :'re.Pattern' = re.compile(r'\n(\s*)(.+?)({*)(}*)(?=\n)')
+REGEX_FIELD_VALUE     :'re.Pattern' = re.compile(r'(?<=\n)(\s*)([a-zA-Z]\w*)(:\s*)(.+?)(\s*\n)')
+REGEX_TAGGED_STR      :'re.Pattern' = re.compile(
+    r'([\'"])' + re.escape(STR_TAG) + r'(.*?)([\'"])\s*\n')
+
 logger :logging.Logger = logging.getLogger(name=__name__)
 
 state :dict = dict()
@@ -37,6 +58,14 @@ else:
     state['loader'] = yaml.SafeLoader
 
 
+def _yaml_load(s:str, **load_kwds)->'Any':
+    return yaml.load(s, Loader=state['loader'], **load_kwds)
+
+
+def _yaml_dump(o:'Any', **dump_kwds)->str:
+    return yaml.dump(o, Dumper=dumper, **dump_kwds)
+
+
 def set_default_dict_type(dict_cls:type):
     r"""override default dict class"""
 
@@ -50,28 +79,30 @@ def set_default_dict_type(dict_cls:type):
 
         def construct_mapping(
                 self, node:Node,
-                *args, **kwds)->'Mapping[Any, Any]':
+                *args, _make:type=dict_cls, **kwds)->'Mapping[Any, Any]':
             if not isinstance(node, yaml.nodes.MappingNode):
                 raise ConstructorError(
                     None, None,
                     "expected a mapping node, but found %s" % (node.id, ),
                     node.start_mark)
-            mapping = dict_cls()
+            mapping = _make()
+            construct_object = self.construct_object
             for key_node, value_node in node.value:
-                key = self.construct_object(key_node, *args, **kwds)
+                key = construct_object(key_node, *args, **kwds)
                 if not isinstance(key, Hashable):
                     raise ConstructorError("while constructing a mapping", node.start_mark,
                                            "found unhashable key", key_node.start_mark)
-                value = self.construct_object(value_node, *args, **kwds)
+                value = construct_object(value_node, *args, **kwds)
                 mapping[key] = value
             return mapping
 
-        def construct_yaml_map(self, node:Node):
-            data = dict_cls()
+        def construct_yaml_map(self, node:Node, _make:type=dict_cls):
+            data = _make()
             yield data
 
-            value = self.construct_mapping(node)
-            data.update(value)
+            # HINT: set item by item, the dict class may sync its state only in __setitem__
+            for key, value in self.construct_mapping(node).items():
+                data[key] = value
 
     Constructor.add_constructor(u'tag:yaml.org,2002:map', Constructor.construct_yaml_map)
 
@@ -118,56 +149,170 @@ def load_prototxt(
     """
 
     # HINT: in fact no load_kwds required
-    load = lambda s: yaml.load(s, Loader=state['loader'], **load_kwds)
+    if ':' not in s and '{' not in s: # scalar, without searching
+        return _yaml_load(s, **load_kwds)
 
-    if not re.search(r'[a-zA-Z]\w*\s*[{:]', s): # if scalar
-        return load(s)
+    if not REGEX_SCALAR.search(s): # if scalar
+        return _yaml_load(s, **load_kwds)
 
     unames = dict()
+    keys = [] # leading keys in order, as written
 
-    def replace_key(s):
-        t = StringIO()
+    # in a single pass: rstrip each line, add : for field, replace key, add , for flow mapping
+    def to_flow_mapping(s, rename=False):
+        parts = []
+        key_indices = []
         start = 0
-        idx = 0
-        for m in re.finditer(r'(\n\s*)([a-zA-Z]\w*)\s*:', s):
-            prefix, ok = m.groups()
-            nk = ok + DELIMITER + UNAME_ID_FORMAT.format(idx)
-            unames[nk] = ok
-            t.write(s[start:m.start()])
-            t.write(prefix)
-            t.write(nk)
-            t.write(':')
+        for m in REGEX_FLOW_REWRITE.finditer(s):
+            mstart = m.start()
+            parts.append(s[start:mstart])
             start = m.end()
-            idx += 1
-        t.write(s[start:])
-        return t.getvalue()
-
+            if m.lastgroup == 'brace':
+                parts.append(': {')
+                continue
+
+            if mstart > 0 and s[mstart - 1] != '{':
+                parts.append(',')
+            parts.append('\n')
+            parts.append(m.group('indent'))
+            ok = m.group('key')
+            if ok is not None:
+                key_indices.append(len(parts))
+                parts.append(ok)
+                parts.append(':' if m.group('key_end').endswith(':') else ': {')
+        parts.append(s[start:])
+
+        keys[:] = [parts[i] for i in key_indices]
+        # only repeated fields require unique names for parsing
+        # HINT: names YAML 1.1 resolves as bool / None are renamed as well, to be loaded as str
+        if rename or len(set(keys)) < len(keys) or not YAML_RESERVED_KEYS.isdisjoint(keys):
+            for idx, i in enumerate(key_indices):
+                ok = parts[i]
+                nk = ok + DELIMITER + UNAME_ID_FORMAT.format(idx)
+                unames[nk] = ok
+                parts[i] = nk
+        return ''.join(parts)
+
+    # HINT: renamed in place, relies on the dict class preserving insertion order
     def restore_key(no):
-        oo = type(no)()
-        for nk, nv in no.items():
+        for nk, nv in list(no.items()):
             ok = unames[nk]
+            no.pop(nk) # pop: EasyDict syncs attributes on pop
             nv = restore_key(nv) if isinstance(nv, dict) else nv
-            ov = oo.get(ok)
+            ov = no.get(ok)
             if ov is None:
-                oo[ok] = nv
+                no[ok] = nv
             else:
                 if not isinstance(ov, list):
-                    oo[ok] = [ov]
-                oo[ok].append(nv)
-        return oo
+                    no[ok] = [ov]
+                no[ok].append(nv)
+        return no
+
+    # pre-order keys of the parsed mappings, to be matched with the leading keys
+    def loaded_keys(no, ret):
+        for nk, nv in no.items():
+            ret.append(nk)
+            if isinstance(nv, dict):
+                loaded_keys(nv, ret)
+        return ret
 
     s = '\n' + s + '\n'
-    s = re.sub(r'\s+\n', '\n', s) # rstrip each line
-    s = re.sub(r'(?<=\w)\s*{\n', ': {\n', s) # add : for field
-    s = replace_key(s)
-    s = re.sub(r'(?<=[^{\s])\n', ',\n', s) # add, for flow mapping
-    s = '{' + s + '}' # simply
+    t = to_flow_mapping(s)
+    t = '{' + t + '}' # simply
 
     # NOTE: Python 3 built-in ordered dict makes repeated fields parsing perfect
     # see yaml/constructor.py: BaseConstructor.construct_mapping for details
-    o = load(s)
+    o = _yaml_load(t, **load_kwds)
+
+    if unames:
+        return restore_key(o)
+
+    # HINT: keys not loaded as written, like 'a:1', are rejected by restore_key with renaming
+    if loaded_keys(o, []) != keys:
+        t = '{' + to_flow_mapping(s, rename=True) + '}'
+        o = _yaml_load(t, **load_kwds)
+        return restore_key(o)
+
+    return o
+
+
+# impl from protobuf, cached for repeated values like enums
+@lru_cache(maxsize=4096)
+def _is_numeric(s:str)->bool:
+    if REGEX_INF.match(s):
+        return True
+    if REGEX_NAN.match(s):
+        return True
+    if not REGEX_NUMERIC_HEAD.match(s): # skip raising for common strings
+        return False
+    try:
+        float(s.rstrip('f')) # throw ValueError
+    except ValueError:
+        return False
+    else:
+        return True
+
+
+def _replace_dict(no:'Mapping[str, Any]', ok:str, ov:'Mapping[str, Any]'):
+    no[ok] = _replace_key_value(ov)
+
+
+def _replace_str(no:'Mapping[str, Any]', ok:str, ov:str):
+    no[ok] = ov if _is_numeric(ov) else STR_TAG + ov # skip numeric literals
+
+
+def _replace_list(no:'Mapping[str, Any]', ok:str, ov:'Sequence[Any]'):
+    prefix = str(ok) + DELIMITER
+    for idx, oi in enumerate(ov):
+        assert not isinstance(oi, LIST_CLSS), f'list item {oi!r} cannot be unnamed list'
+
+        nk = prefix + UNAME_ID_FORMAT.format(idx) # make key ordered
+        ni = _replace_key_value(oi) if isinstance(oi, dict) else oi
+        no[nk] = ni
+
+
+def _replace_scalar(no:'Mapping[str, Any]', ok:str, ov:'Any'):
+    no[ok] = ov
+
 
-    return restore_key(o)
+# value type -> replacer, subclasses are resolved and registered on first sight
+_REPLACERS :'Mapping[type, Callable]' = {
+    dict: _replace_dict,
+    str: _replace_str,
+    list: _replace_list, tuple: _replace_list, set: _replace_list,
+}
+
+
+def _resolve_replacer(cls:type)->'Callable':
+    if issubclass(cls, dict):
+        replacer = _replace_dict
+    elif issubclass(cls, str):
+        replacer = _replace_str
+    elif issubclass(cls, LIST_CLSS):
+        replacer = _replace_list
+    else:
+        replacer = _replace_scalar
+    _REPLACERS[cls] = replacer
+    return replacer
+
+
+def _replace_key_value(oo:'Mapping[str, Any]')->'Mapping[str, Any]':
+    no = type(oo)()
+    get_replacer = _REPLACERS.get
+    for ok, ov in oo.items():
+        assert DELIMITER not in ok, f'invalid field name {ok!r} in Protobuf'
+
+        cls = type(ov)
+        replacer = get_replacer(cls) or _resolve_replacer(cls)
+        replacer(no, ok, ov)
+    return no
+
+
+# sorting is a required default behavior
+_DEFAULT_DUMP_KWDS :'Mapping[str, Any]' = dict(
+    indent=2, width=(2 * 2 + 1),
+    default_flow_style=True, allow_unicode=True, # sort_keys=True,
+)
 
 
 def dump_prototxt(
@@ -185,17 +330,16 @@ def dump_prototxt(
     dump_kwds: kwds for 'yaml.dump'
     """
 
-    list_clss = (list, tuple, set)
+    assert not isinstance(o, LIST_CLSS), f"'o' {o!r}cannot be unnamed list"
 
-    assert not isinstance(o, list_clss), f"'o' {o!r}cannot be unnamed list"
-
-    # sorting is a required default behavior
-    dump_kwds_ = dict(
-        indent=indent, width=(indent * 2 + 1),
-        default_flow_style=True, allow_unicode=True, # sort_keys=True,
-    )
-    dump_kwds_.update(dump_kwds)
-    dump = lambda o: yaml.dump(o, Dumper=dumper, **dump_kwds_)
+    if dump_kwds or indent != _DEFAULT_DUMP_KWDS['indent']:
+        dump_kwds = {
+            **_DEFAULT_DUMP_KWDS,
+            'indent': indent, 'width': (indent * 2 + 1),
+            **dump_kwds,
+        }
+    else:
+        dump_kwds = _DEFAULT_DUMP_KWDS
 
     def remove_document_end(s):
         t = '\n...'
@@ -210,112 +354,78 @@ def dump_prototxt(
             else:
                 s = quote + o + quote
         else:
-            s = dump(o)
+            s = _yaml_dump(o, **dump_kwds)
             s = s.strip()
             s = remove_document_end(s)
         return s + '\n'
 
-    str_tag = '!str '
-
-    # impl from protobuf
-    def is_numeric(s):
-        if re.match(r'-?inf(?:inity)?f?', s, re.IGNORECASE):
-            return True
-        if re.match(r'nanf?', s, re.IGNORECASE):
-            return True
-        try:
-            float(s.rstrip('f')) # throw ValueError
-        except ValueError:
-            return False
-        else:
-            return True
-
-    def replace_key_value(oo):
-        no = type(oo)()
-        for ok, ov in oo.items():
-            assert DELIMITER not in ok, f'invalid field name {ok!r} in Protobuf'
-
-            if isinstance(ov, dict):
-                no[ok] = replace_key_value(ov)
-            elif isinstance(ov, str):
-                no[ok] = ov if is_numeric(ov) else str_tag + ov # skip numeric literals
-            elif isinstance(ov, list_clss):
-                prefix = str(ok) + DELIMITER
-                for idx, oi in enumerate(ov):
-                    assert not isinstance(oi, list_clss), (
-                        f'list item {oi!r} cannot be unnamed list')
-
-                    nk = prefix + UNAME_ID_FORMAT.format(idx) # make key ordered
-                    ni = replace_key_value(oi) if isinstance(oi, dict) else oi
-                    no[nk] = ni
-            else:
-                no[ok] = ov
-        return no
-
     def restore_key(s):
-        t = StringIO()
+        parts = []
+        append = parts.append
         start = 0
-        for m in re.finditer(r'(\n\s*)([a-zA-Z]\w*)' + DELIMITER + r'\d+\s*:', s):
+        for m in REGEX_UNAME_KEY.finditer(s):
             prefix, ok = m.groups()
-            t.write(s[start:m.start()])
-            t.write(prefix)
-            t.write(ok)
-            t.write(':')
+            append(s[start:m.start()])
+            append(prefix)
+            append(ok)
+            append(':')
             start = m.end()
-        t.write(s[start:])
-        return t.getvalue()
+        append(s[start:])
+        return ''.join(parts)
 
     def fix_mapping_end_break(s):
-        t = StringIO()
+        parts = []
+        append = parts.append
         start = 0
         current_space_size = 0
-        for m in re.finditer(r'\n(\s*)(.+?)({*)(}*)(?=\n)', s):
+        for m in REGEX_MAPPING_LINE.finditer(s):
             spaces, content, lbraces, rbraces = m.groups()
-            t.write(s[start:m.start()])
+            append(s[start:m.start()])
 
             if len(spaces) > current_space_size:
                 assert len(spaces) == current_space_size + indent
 
                 spaces = spaces[:current_space_size]
-                t.write(' ')
+                append(' ')
             else:
                 assert len(spaces) == current_space_size
 
-                t.write('\n')
-                t.write(spaces)
+                append('\n')
+                append(spaces)
 
             current_space_size += indent * len(lbraces)
             assert current_space_size >= len(rbraces) * indent
 
             spaces = ' ' * current_space_size
             current_space_size -= indent * len(rbraces)
-            t.write(content)
-            t.write(lbraces)
+            append(content)
+            append(lbraces)
 
             for brace in rbraces:
                 spaces = spaces[:-indent]
-                t.write('\n')
-                t.write(spaces)
-                t.write(brace)
+                append('\n')
+                append(spaces)
+                append(brace)
 
             start = m.end()
 
-        t.write(s[start:])
-        return t.getvalue()
+        append(s[start:])
+        return ''.join(parts)
 
     def fix_value_quote(s):
-        t = StringIO()
+        parts = []
+        append = parts.append
         start = 0
-        str_re = re.compile(r'([\'"])' + str_tag + r'(.*?)([\'"])\s*\n') #
-        for m in re.finditer(r'(?<=\n)(\s*)([a-zA-Z]\w*)(:\s*)(.+?)(\s*\n)', s):
+        match_tagged_str = REGEX_TAGGED_STR.match
+        for m in REGEX_FIELD_VALUE.finditer(s):
             s0, key, s1, value, s2 = m.groups()
-            t.write(s[start:m.start()])
-            t.write(s0)
-            t.write(key)
-            t.write(s1)
+            append(s[start:m.start()])
+            append(s0)
+            append(key)
+            append(s1)
 
             unquoted = True
-            str_match = str_re.match(value + s2)
+            str_match = match_tagged_str(value + s2)
             if str_match:
                 lquote, value, rquote = str_match.groups()
                 if lquote == rquote:
@@ -323,22 +433,22 @@ def dump_prototxt(
                         unquoted = False
                         if lquote != quote and quote not in value: # HINT: not forced
                             lquote = quote
-                        t.write(lquote)
-                        t.write(value)
-                        t.write(lquote)
+                        append(lquote)
+                        append(value)
+                        append(lquote)
 
             if unquoted:
-                t.write(value)
+                append(value)
 
-            t.write(s2)
+            append(s2)
             start = m.end()
 
-        t.write(s[start:])
-        return t.getvalue()
+        append(s[start:])
+        return ''.join(parts)
 
-    o = replace_key_value(o)
+    o = _replace_key_value(o)
     # HINT: ~ canonical=True
-    s = dump(o)
+    s = _yaml_dump(o, **dump_kwds)
     s = '\n' + s.strip()[1: -1].replace('\n  ', '\n') + '\n' # remove root flow mapping brace
     s = restore_key(s)
     s = s.replace(',\n', '\n').replace(': {', ' {') # remove , and :)
@@ -360,6 +470,17 @@ if __name__ == '__main__':
     o = load_prototxt(t)
     print(o)
     print('-' * 8)
+    o = load_prototxt('on: 1\nOff: 2\nlayer {\n  null: 3\n  no: true\n}\n')
+    print(o)
+    assert all(isinstance(k, str) for k in o) and all(isinstance(k, str) for k in o['layer'])
+    print('-' * 8)
+    for t in ('a:1', 'a:1\nb: 2', 'on:1', 'null:"x"', 'on:', 'on: ', 'layer {\n  on:\n}\n'):
+        try:
+            o = load_prototxt(t)
+        except (KeyError, yaml.YAMLError):
+            pass
+        else:
+            raise AssertionError(f'{t!r} loaded as {o!r}')
 
     from easydict import EasyDict
 
@@ -8,11 +8,58 @@ Created on Tue Sep 22 21:03:43 2020
 
 from __future__ import absolute_import, division, unicode_literals
 
-import re
+import builtins, operator, re
+
+from functools import lru_cache
+from itertools import chain
 
 from quick_prototxt import load_prototxt
 
 
+REGEX_SPACES        :'re.Pattern' = re.compile(r'\s*')
+# HINT: literals loaded as is by YAML, others (e.g. '010', '1_0', 'yes') go through 'load_prototxt'
+REGEX_PLAIN_LITERAL :'re.Pattern' = re.compile(
+    r'(?P<int>0|[1-9][0-9]*)|"[^"\\\n:{]*"|\'[^\'\\\n:{]*\'')
+
+
+# HINT: repeated fields are loaded as exact lists, 'type is' is cheaper than 'isinstance'
+_ensure_seq :'Callable[[Any], list]' = lambda r: r if type(r) is list else [r]
+
+
+@lru_cache(maxsize=1024)
+def _compile_source(source:str)->'CodeType':
+    r"""compile generated source, cached for paths of the same shape"""
+
+    return builtins.compile(source, '<ypath>', 'exec') # HINT: 'compile' is overrided below
+
+
+@lru_cache(maxsize=512)
+def _decode_literal(source:str)->'Any':
+    r"""decode a predicate target literal like 'load_prototxt', cached"""
+
+    m = REGEX_PLAIN_LITERAL.fullmatch(source)
+    if m is None or not source.isprintable():
+        return load_prototxt(source)
+    if m.group('int') is not None:
+        return int(source)
+    return source[1:-1]
+
+
+@lru_cache(maxsize=None)
+def _seperator_regex(seperator:str)->'re.Pattern':
+    r"""regex skips seperators and spaces, like 'str.lstrip(seperator).lstrip()'"""
+
+    return re.compile((f'[{re.escape(seperator)}]*' if seperator else '') + r'\s*')
+
+
+@lru_cache(maxsize=None)
+def _seperated_node_regex(seperator:str)->'re.Pattern':
+    r"""regex matches seperators, a 'Node' and trailing spaces in one go"""
+
+    return re.compile(
+        _seperator_regex(seperator).pattern + '(?a:' + Node.PATTERN + r')\s*')
+
+
 class YPathSyntaxError(Exception):
     r"""SyntaxError for YPath"""
 
@@ -45,46 +92,61 @@ class Node(object):
     r"""node: a basic field in a struct"""
 
     PATTERN :str          = r'([a-zA-Z]\w*)(?:\s*@\s*([\-\+]?\d+))?'
-    REGEX   :'re.Pattern' = re.compile(PATTERN)
+    REGEX   :'re.Pattern' = re.compile(PATTERN, re.ASCII) # field names are ASCII in Protobuf
+
+    _match_full :'Callable' = REGEX.fullmatch # bound once
+    _match_part :'Callable' = REGEX.match
+
+    __slots__ = ('name', 'index', '_get')
 
     name  :str
-    index :'Optional[int]' = None
+    index :'Optional[int]'
+
+    def __init__(self):
+        self.index = None
 
     def __repr__(self)->str:
         index = '' if self.index is None else f'@{self.index}'
         return f'<Node {self.name}{index}>'
 
     def parse(self, text:str,
-              full:bool=True)->int:
-        r"""parse from text fully or partially from head"""
+              full:bool=True, pos:int=0)->int:
+        r"""parse from text[pos:] fully or partially from head, returns the end position"""
 
-        m = (Node.REGEX.fullmatch if full else Node.REGEX.match)(text)
+        m = (Node._match_full if full else Node._match_part)(text, pos)
         if not m:
-            raise YPathSyntaxError(Node, text)
+            raise YPathSyntaxError(Node, text[pos:])
 
-        self.name, index = m.groups()
-        self.index = index and int(index)
+        self._set(*m.groups())
         return m.end()
 
+    def _set(self, name:str, index:'Optional[str]'):
+        r"""set the parsed name and index, with access specialized"""
+
+        self.name = name
+        self.index = index and int(index)
+        if self.index is None: # specialized, without checking index on access
+            self._get = operator.itemgetter(self.name)
+        else:
+            self._get = lambda mapping, name=self.name, index=self.index: mapping[name][index]
+
     def access(self, mapping:'Mapping[str, Any]')->'Any':
         r"""acess the item specified by this node in a mapping object"""
 
-        ret = mapping[self.name]
-        if self.index is not None:
-            ret = ret[self.index]
-        return ret
+        return self._get(mapping)
 
     def collect(self, mapping:'Mapping[str, Any]',
                 with_name:bool=False)->'Sequence[Any]':
         r"""collect all items matches this node in a mapping object"""
 
         try:
-            ret = self.access(mapping)
+            ret = _ensure_seq(self._get(mapping))
         except (LookupError, TypeError):
-            ret = []
-        else:
-            ret = ret if isinstance(ret, list) else [ret]
-        return [{self.name: r} for r in ret] if with_name else ret
+            return []
+        if with_name:
+            name = self.name
+            return [{name: r} for r in ret]
+        return ret
 
 
 class Path(object):
@@ -92,6 +154,8 @@ class Path(object):
 
     NodeClass :type = Node
 
+    __slots__ = ('nodes', 'seperator', '_generated')
+
     nodes     :'Sequence[NodeClass]'
     seperator :str
 
@@ -110,61 +174,214 @@ class Path(object):
         return self.nodes[i]
 
     def parse(self, text:str,
-              full:bool=True)->int:
-        r"""parse from text fully or partially from head"""
+              full:bool=True, pos:int=0)->int:
+        r"""parse from text[pos:] fully or partially from head, returns the end position"""
+
+        start = pos
+        if self.NodeClass is Node: # HINT: fast path for plain nodes, e.g. attribute paths
+            nodes = []
+            match_node = _seperated_node_regex(self.seperator).match
+            while pos < len(text) and (not nodes or text.startswith(self.seperator, pos)):
+                m = match_node(text, pos)
+                if not m:
+                    break
+
+                node = Node()
+                node._set(*m.groups())
+                nodes.append(node)
+                pos = m.end()
+
+            if nodes and not (full and pos < len(text)):
+                self.nodes = tuple(nodes)
+                self._generated = None # on first use
+                return pos
+
+            pos = start # errors are reported as below
 
-        text_ = text
         nodes = []
         exception = None
+        skip_seperators = _seperator_regex(self.seperator).match
         while True:
-            if not text_:
+            if pos == len(text):
                 break
-            if nodes and not text_.startswith(self.seperator): # permit first omission
+            if nodes and not text.startswith(self.seperator, pos): # permit first omission
                 exception = YPathSyntaxError(
-                    Path, text, 'seperator expected', len(text) - len(text_))
+                    Path, text[start:], 'seperator expected', pos - start)
                 break
-            text__ = text_.lstrip(self.seperator).lstrip() #
             node = self.NodeClass()
             try:
-                pos = node.parse(text__, full=False)
+                end = node.parse(text, full=False, pos=skip_seperators(text, pos).end())
             except YPathSyntaxError as e:
                 exception = e
                 break
             else:
                 nodes.append(node)
-                text_ = text__[pos:].lstrip()
+                pos = REGEX_SPACES.match(text, end).end()
 
         if not nodes:
-            raise YPathSyntaxError(Path, text, 'node expected', len(text) - len(text_))
-        if full and text_:
+            raise YPathSyntaxError(Path, text[start:], 'node expected', pos - start)
+        if full and pos < len(text):
             if exception is None:
-                raise YPathSyntaxError(Path, text, 'unexpected token', len(text) - len(text_))
+                raise YPathSyntaxError(Path, text[start:], 'unexpected token', pos - start)
             else:
                 raise exception
 
         self.nodes = tuple(nodes)
-        return len(text) - len(text_)
+        self._generated = None # on first use
+        return pos
+
+    # NOTE: parsed paths are shared, mutating them (e.g. re-parsing) is unsupported
+    @classmethod
+    @lru_cache(maxsize=1024)
+    def parse_cached(cls, text:str,
+                     seperator:str='/')->'Path':
+        r"""parse text fully into a path of this class, cached for repeated text"""
+
+        path = cls(seperator=seperator)
+        path.parse(text)
+        return path
+
+    # NOTE: generated from the parsed nodes once used, modifying them later has no effect
+    def _codegen(self)->'Tuple[Callable, Callable, Callable]':
+        r"""generate 'access' and 'collect'(with_name=False / True) for parsed nodes"""
+
+        namespace = dict()
+        access = ['def access(mapping):', '    ret = mapping']
+        collects = tuple(
+            [f'def {name}(mapping):', '    ret = [mapping]']
+            for name in ('collect', 'collect_with_name'))
+        for k, node in enumerate(self.nodes):
+            namespace[f'node_{k}'] = node
+            if type(node) is NodeGroup and len(node.nodes) == 1: # unwrap the single 'Node'
+                inner, unique = node.nodes[0], True
+            else:
+                inner, unique = node, False
+            if type(inner) not in (Node, NodeWithPredicates): # generic
+                namespace[f'collect_{k}'] = node.collect # bound once
+                access.append(f'    ret = node_{k}.access(ret)')
+                for with_name, collect in zip((False, True), collects):
+                    with_name = with_name and k == len(self.nodes) - 1
+                    collect.extend([
+                        '    items = []',
+                        '    extend = items.extend',
+                        '    for i in ret:',
+                        f'        extend(collect_{k}(i, with_name={with_name}))',
+                        '    ret = items',
+                    ])
+                continue
+
+            getters = [f'r = i[{inner.name!r}]']
+            if inner.index is not None:
+                getters.append(f'r = r[{inner.index!r}]')
+            cond = ''
+            if getattr(inner, 'predicates', None):
+                namespace[f'match_{k}'] = inner._match_all
+                cond = f' if match_{k}(x)'
+
+            if not unique:
+                access.append(f'    ret = ret[{inner.name!r}]')
+                if inner.index is not None:
+                    access.append(f'    ret = ret[{inner.index!r}]')
+                if cond:
+                    access.extend([
+                        f'    if not match_{k}(ret):',
+                        "        raise LookupError('item not match predicates')",
+                    ])
+            else: # 'NodeGroup' has no access
+                access.append(f'    ret = node_{k}.access(ret)')
+
+            for with_name, collect in zip((False, True), collects):
+                with_name = with_name and k == len(self.nodes) - 1
+                items, item_cond = ('r', cond)
+                if unique: # deduplicated by id as 'NodeGroup.collect'
+                    items, item_cond = (f'{{id(x): x for x in r{cond}}}.values()', '')
+                if with_name:
+                    items = f'[{{{inner.name!r}: x}} for x in {items}{item_cond}]'
+                elif item_cond:
+                    items = f'[x for x in {items}{item_cond}]'
+                item = f'{{{inner.name!r}: r}}' if with_name else 'r'
+                collect.extend([
+                    '    items = []',
+                    '    for i in ret:',
+                    '        try:',
+                    *('            ' + g for g in getters),
+                    '        except (LookupError, TypeError):',
+                    '            continue',
+                    '        if type(r) is list:',
+                    f'            items.extend({items})',
+                    f'        elif match_{k}(r):' if cond else '        else:',
+                    f'            items.append({item})',
+                    '    ret = items',
+                ])
+
+        access.append('    return ret')
+        for collect in collects:
+            collect.append('    return ret')
+        source = '\n'.join(access + collects[0] + collects[1])
+        exec(_compile_source(source), namespace)
+        self._generated = namespace['access'], namespace['collect'], namespace['collect_with_name']
+        return self._generated
+
+    def getter(self)->'Callable[[Mapping[str, Any]], Any]':
+        r"""the fastest callable equivalent to 'access' of this parsed path"""
+
+        if len(self.nodes) == 1 and type(self.nodes[0]) is Node:
+            return self.nodes[0]._get
+        return (self._generated or self._codegen())[0]
 
     def access(self, mapping:'Mapping[str, Any]')->'Any':
         r"""acess the item specified by this path in a mapping object"""
 
-        ret = mapping
-        for node in self.nodes:
-            ret = node.access(ret)
-        return ret
+        return (self._generated or self._codegen())[0](mapping)
 
     def collect(self, mapping:'Mapping[str, Any]',
                 with_name:bool=False)->'Sequence[Any]':
         r"""collect all items matches this path in a mapping object"""
 
-        ret = [mapping]
-        for node in self.nodes[:-1]:
-            ret = sum((node.collect(i) for i in ret), [])
-        if with_name:
-            ret = sum((self.nodes[-1].collect(i, with_name=with_name) for i in ret), [])
-        else:
-            ret = sum((self.nodes[-1].collect(i) for i in ret), [])
-        return ret
+        return (self._generated or self._codegen())[2 if with_name else 1](mapping)
+
+
+def _compile_predicate_chain(predicates:'Sequence[Predicate]')->'Callable[[Any], bool]':
+    r"""specialize 'all(p.match(item) for p in predicates)' for parsed predicates"""
+
+    if not predicates:
+        return lambda item: True
+    if len(predicates) == 1:
+        return predicates[0].matcher()
+
+    # HINT: fused into one generated function, comparisons are outside of 'try' as 'match'
+    namespace = dict()
+    source = ['def match_all(item):']
+    for k, predicate in enumerate(predicates):
+        if type(predicate) is MatchAttrPredicate:
+            namespace[f'get_{k}'] = predicate._get
+            namespace[f'target_{k}'] = predicate.target
+            expression = MatchAttrPredicate.EXPRESSIONS[predicate.operator].format(
+                item=f'value_{k}', target=f'target_{k}')
+            source.extend([
+                '    try:',
+                f'        value_{k} = get_{k}(item)',
+                '    except (LookupError, TypeError):',
+                '        return False',
+                f'    if not ({expression}):',
+                '        return False',
+            ])
+        elif type(predicate) is HasAttrPredicate:
+            namespace[f'get_{k}'] = predicate._get
+            source.extend([
+                '    try:',
+                f'        get_{k}(item)',
+                '    except (LookupError, TypeError):',
+                '        pass' if predicate.inversed else '        return False',
+            ])
+            if predicate.inversed:
+                source.extend(['    else:', '        return False'])
+        else: # generic
+            namespace[f'match_{k}'] = predicate.matcher()
+            source.extend([f'    if not match_{k}(item):', '        return False'])
+    source.append('    return True')
+    exec(_compile_source('\n'.join(source)), namespace)
+    return namespace['match_all']
 
 
 # @inherit_docs
@@ -174,8 +391,17 @@ class NodeWithPredicates(Node):
     PREDICATES_BEGIN     :str = r'('
     PREDICATES_END       :str = r')'
     PREDICATES_DELIMITER :str = r'|'
+    REGEX_TOKEN          :'re.Pattern' = re.compile(r'\s*([()|]?)\s*')
 
-    predicates :'Sequence[Predicate]' = tuple()
+    __slots__ = ('predicates', '_match_all')
+
+    predicates :'Sequence[Predicate]'
+    _match_all :'Callable[[Any], bool]' # of predicates
+
+    def __init__(self):
+        super().__init__()
+        self.predicates = tuple()
+        self._match_all = _compile_predicate_chain(self.predicates)
 
     def __repr__(self)->str:
         index = '' if self.index is None else f'@{self.index}'
@@ -184,66 +410,78 @@ class NodeWithPredicates(Node):
         return f'<NodeWithPredicates {self.name}{index}{predicates}>'
 
     def parse(self, text:str,
-              full:bool=True)->int:
-        pos = super().parse(text, full=False)
-        text_ = text[pos:].lstrip()
+              full:bool=True, pos:int=0)->int:
+        start = pos
+        pos = super().parse(text, full=False, pos=pos)
         predicates = []
         started = False
+        match_token = NodeWithPredicates.REGEX_TOKEN.match
+        begin, delimiter, end = (
+            NodeWithPredicates.PREDICATES_BEGIN,
+            NodeWithPredicates.PREDICATES_DELIMITER,
+            NodeWithPredicates.PREDICATES_END,
+        )
         while True:
-            if started:
-                if not text_:
+            m = match_token(text, pos)
+            token = m.group(1)
+            if token == begin and not started:
+                started = True
+            elif token == delimiter and started:
+                pass
+            elif token == end and started:
+                pos = m.end(1)
+                if full and pos < len(text):
                     raise YPathSyntaxError(
-                        NodeWithPredicates, text, 'trailing predicates', len(text))
-                if text_[0] == NodeWithPredicates.PREDICATES_END:
-                    text_ = text_[1:]
-                    if full and text_:
-                        raise YPathSyntaxError(
-                            NodeWithPredicates, text,
-                            'unexpected token', len(text) - len(text_))
-                    break
-                elif text_[0] == NodeWithPredicates.PREDICATES_DELIMITER:
-                    text_ = text_[1:].lstrip()
-                    predicate = Predicate()
-                    pos = predicate.parse(text_, full=False)
-                    predicates.append(predicate)
-                    text_ = text_[pos:].lstrip()
-                    continue
-                raise YPathSyntaxError(
-                    NodeWithPredicates, text, 'unexpected token', len(text) - len(text_))
+                        NodeWithPredicates, text[start:], 'unexpected token', pos - start)
+                break
             else:
-                if not text_:
-                    break
-                if text_[0] == NodeWithPredicates.PREDICATES_BEGIN:
-                    started = True
-                    text_ = text_[1:].lstrip()
-                    predicate = Predicate()
-                    pos = predicate.parse(text_, full=False)
-                    predicates.append(predicate)
-                    text_ = text_[pos:].lstrip()
-                    continue
-                if full:
+                pos = m.start(1)
+                if started:
+                    if pos == len(text):
+                        raise YPathSyntaxError(
+                            NodeWithPredicates, text[start:],
+                            'trailing predicates', len(text) - start)
                     raise YPathSyntaxError(
-                        NodeWithPredicates, text, 'unexpected token', len(text) - len(text_))
+                        NodeWithPredicates, text[start:], 'unexpected token', pos - start)
+                if full and pos < len(text):
+                    raise YPathSyntaxError(
+                        NodeWithPredicates, text[start:], 'unexpected token', pos - start)
                 break
+
+            predicate, pos = _parse_predicate(text, m.end())
+            predicates.append(predicate)
         self.predicates = tuple(predicates)
-        return len(text) - len(text_)
+        self._match_all = _compile_predicate_chain(self.predicates)
+        return pos
 
     def access(self, mapping:'Mapping[str, Any]')->'Any':
-        ret = super().access(mapping)
-        if not all(p.match(ret) for p in self.predicates):
+        ret = self._get(mapping)
+        if self.predicates and not self._match_all(ret):
             raise LookupError('item not match predicates')
         return ret
 
     def collect(self, mapping:'Mapping[str, Any]',
                 with_name:bool=False)->'Sequence[Any]':
         try:
-            items = super().access(mapping)
+            items = self._get(mapping)
         except (LookupError, TypeError):
-            items = []
-        else:
-            items = items if isinstance(items, list) else [items]
-        ret = list(i for i in items if all(p.match(i) for p in self.predicates))
-        return [{self.name: r} for r in ret] if with_name else ret
+            return []
+
+        if not self.predicates: # without matching
+            if type(items) is not list:
+                return [{self.name: items}] if with_name else [items]
+            if with_name:
+                name = self.name
+                return [{name: i} for i in items]
+            return items.copy()
+
+        match_all = self._match_all
+        if type(items) is not list: # single item, without wrapping
+            return ([{self.name: items}] if with_name else [items]) if match_all(items) else []
+        if with_name:
+            name = self.name
+            return [{name: i} for i in items if match_all(i)]
+        return [i for i in items if match_all(i)]
 
 
 class NodeGroup(object):
@@ -252,10 +490,13 @@ class NodeGroup(object):
     NODES_BEGIN     :str = r'{'
     NODES_END       :str = r'}'
     NODES_DELIMITER :str = r','
+    REGEX_TOKEN     :'re.Pattern' = re.compile(r'\s*([{,}]?)\s*')
 
     NodeClass: type = NodeWithPredicates
     PathClass: type = Path # placeholder, will be overrided later
 
+    __slots__ = ('nodes', )
+
     nodes :'Sequence[NodeWithPredicates]'
 
     def __repr__(self)->str:
@@ -269,52 +510,67 @@ class NodeGroup(object):
         return self.nodes[i]
 
     def parse(self, text:str,
-              full:bool=True)->int:
-        r"""parse from text fully or partially from head"""
+              full:bool=True, pos:int=0)->int:
+        r"""parse from text[pos:] fully or partially from head, returns the end position"""
 
-        if not text:
-            raise YPathSyntaxError(NodeGroup, text)
+        if pos == len(text):
+            raise YPathSyntaxError(NodeGroup, text[pos:])
 
-        text_ = text
+        start = pos
         nodes = []
-        if text_[0] == NodeGroup.NODES_BEGIN:
+        if text[pos] == NodeGroup.NODES_BEGIN:
+            match_token = NodeGroup.REGEX_TOKEN.match
+            PathClass = self.PathClass
+            delimiter, end = NodeGroup.NODES_DELIMITER, NodeGroup.NODES_END
+            m = match_token(text, pos)
             while True:
-                text_ = text_[1:].lstrip()
-                node = self.PathClass()
-                pos = node.parse(text_, full=False)
+                node = PathClass()
+                pos = node.parse(text, full=False, pos=m.end())
                 nodes.append(node)
-                text_ = text_[pos:].lstrip()
-                if not text_:
-                    raise YPathSyntaxError(NodeGroup, text, 'trailing nodes', len(text))
-                if text_[0] == NodeGroup.NODES_END:
-                    text_ = text_[1:]
-                    if full and text_:
+                m = match_token(text, pos)
+                token = m.group(1)
+                if token == end:
+                    pos = m.end(1)
+                    if full and pos < len(text):
                         raise YPathSyntaxError(
-                            NodeGroup, text, 'unexpected token', len(text) - len(text_))
+                            NodeGroup, text[start:], 'unexpected token', pos - start)
                     break
-                elif text_[0] == NodeGroup.NODES_DELIMITER:
+                elif token == delimiter:
                     continue
-                raise YPathSyntaxError(
-                    NodeGroup, text, 'unexpected token', len(text) - len(text_))
+                pos = m.start(1)
+                if pos == len(text):
+                    raise YPathSyntaxError(
+                        NodeGroup, text[start:], 'trailing nodes', len(text) - start)
+                raise YPathSyntaxError(NodeGroup, text[start:], 'unexpected token', pos - start)
         else:
             node = self.NodeClass()
-            pos = node.parse(text_, full=full)
+            pos = node.parse(text, full=full, pos=pos)
             nodes.append(node)
-            text_ = text_[pos:]
 
         self.nodes = tuple(nodes)
-        return len(text) - len(text_)
+        return pos
 
     def collect(self, mapping:'Mapping[str, Any]',
                 with_name:bool=False)->'Sequence[Any]':
         r"""collect 'Node's"""
 
-        items = sum((n.collect(mapping, with_name=with_name) for n in self.nodes), [])
-        if with_name:
-            items = {id(next(iter(i.values()))): i for i in items}
-        else:
-            items = {id(i): i for i in items}
-        return list(items.values())
+        items = chain.from_iterable(n.collect(mapping, with_name=with_name) for n in self.nodes)
+        if with_name: # HINT: the last name is kept, at the first position
+            named = dict() # by id of the item, unnamed
+            for i in items:
+                (value, ) = i.values() # named as {name: value}
+                named[id(value)] = i
+            return list(named.values())
+
+        seen = set() # by id of the item
+        ret = []
+        add, append = seen.add, ret.append
+        for i in items:
+            key = id(i)
+            if key not in seen:
+                add(key)
+                append(i)
+        return ret
 
 
 # @inherit_docs
@@ -323,64 +579,92 @@ class YPath(Path):
 
     NodeClass :type = NodeGroup
 
+    __slots__ = ()
+
     access = property(doc='Disabled method')
 
 
 NodeGroup.PathClass = YPath
 
 
+def compile(text:str,
+            seperator:str='/')->YPath:
+    r"""parse text into a 'YPath', cached for repeated text like 're.compile'"""
+
+    return YPath.parse_cached(text, seperator)
+
+
 class Predicate(object):
     r"""predicate: the 'Node' filter"""
 
+    # a cheap necessary condition for a successful parse, subclasses failing it are skipped
+    LOOKAHEAD :'Optional[re.Pattern]' = None
+
+    # HINT: shared by all subclasses, for the class swap in 'parse'
+    __slots__ = ('attr_path', '_get', 'inversed', 'operator', 'func', 'target', '_test')
+
     subclasses :'Seqeunce[type]' = []
 
     def parse(self, text:str,
-              full:bool=True)->int:
-        r"""parse from text fully or partially from head"""
+              full:bool=True, pos:int=0)->int:
+        r"""parse from text[pos:] fully or partially from head, returns the end position"""
 
         for cls in Predicate.subclasses:
+            if cls.LOOKAHEAD is not None and not cls.LOOKAHEAD.match(text, pos):
+                continue
+
             try:
-                ret = cls.parse(self, text, full=full)
+                ret = cls.parse(self, text, full=full, pos=pos)
             except YPathSyntaxError:
                 pass
             else:
                 self.__class__ = cls
                 return ret
 
-        raise YPathSyntaxError(Predicate, text)
+        raise YPathSyntaxError(Predicate, text[pos:])
 
     def match(self, mapping:'Mapping[str, Any]')->bool:
         r"""test if a node should be filtered"""
 
         raise NotImplementedError('Abstract method')
 
+    def matcher(self)->'Callable[[Mapping[str, Any]], bool]':
+        r"""the fastest callable equivalent to 'match' of this parsed predicate"""
+
+        return self.match
+
 
 # @inherit_docs
 class HasAttrPredicate(Predicate):
     r"""test if a 'Node' has a field"""
 
+    LOOKAHEAD :'re.Pattern' = re.compile(r'(?:!\s*)?\.*\s*[a-zA-Z]')
+
+    __slots__ = ()
+
     attr_path :Path
-    inversed  :bool = False
+    inversed  :bool
 
     def __repr__(self)->str:
         prefix = '!' if self.inversed else ''
         return f'<HasAttr {prefix}{self.attr_path}>'
 
     def parse(self, text:str,
-              full:bool=True)->int:
-        if not text:
-            raise YPathSyntaxError(HasAttrPredicate, text)
-        text_ = text
-        if text_[0] == '!':
+              full:bool=True, pos:int=0)->int:
+        if pos == len(text):
+            raise YPathSyntaxError(HasAttrPredicate, text[pos:])
+        self.inversed = False
+        if text[pos] == '!':
             self.inversed = True
-            text_ = text_[1:].lstrip()
+            pos = REGEX_SPACES.match(text, pos + 1).end()
         self.attr_path = Path(seperator='.')
-        pos = self.attr_path.parse(text_, full=full)
-        return len(text) - len(text_) + pos
+        pos = self.attr_path.parse(text, full=full, pos=pos)
+        self._get = self.attr_path.getter()
+        return pos
 
     def match(self, mapping:'Mapping[str, Any]')->bool:
         try:
-            self.attr_path.access(mapping)
+            self._get(mapping)
         except (LookupError, TypeError):
             return self.inversed
         else:
@@ -391,20 +675,42 @@ class HasAttrPredicate(Predicate):
 class MatchAttrPredicate(Predicate):
     r"""test if a 'Node' whose field matches target"""
 
-    OPERATORS    :'Mapping[str, Callable[[Any, Any], bool]]' = {
+    OPERATORS           :'Mapping[str, Callable[[Any, Any], bool]]' = {
         # dict is ordered
         # 2 characters
-        '==': lambda a, b: a == b,
-        '!=': lambda a, b: a != b,
-        '<>': lambda a, b: a != b,
-        '>=': lambda a, b: a >= b,
-        '<=': lambda a, b: a <= b,
-        '~=': lambda a, b: b in a,
+        '==': operator.eq,
+        '!=': operator.ne,
+        '<>': operator.ne,
+        '>=': operator.ge,
+        '<=': operator.le,
+        '~=': operator.contains, # b in a
         # 1 character
-        '>' : lambda a, b: a > b,
-        '<' : lambda a, b: a < b,
+        '>' : operator.gt,
+        '<' : operator.lt,
+    }
+    EXPRESSIONS         :'Mapping[str, str]'                        = { # of OPERATORS, for 'matcher'
+        '==': '{item} == {target}',
+        '!=': '{item} != {target}',
+        '<>': '{item} != {target}',
+        '>=': '{item} >= {target}',
+        '<=': '{item} <= {target}',
+        '~=': '{target} in {item}',
+        '>' : '{item} > {target}',
+        '<' : '{item} < {target}',
     }
-    REGEX_TARGET :'re.Pattern'                               = re.compile(r'\w+')
+    OPERATOR_PATTERN    :str                                        = (
+        r'(?:' + '|'.join(map(re.escape, OPERATORS)) + r')') # in order
+    REGEX_TARGET        :'re.Pattern'                               = re.compile(r'\w+', re.ASCII)
+    REGEX_QUOTED_TARGET :'re.Pattern'                               = re.compile(
+        r'"(?:[^"\\]|\\.)*"|\'(?:[^\'\\]|\\.)*\'', re.DOTALL) # with escapes
+    LOOKAHEAD           :'re.Pattern'                               = re.compile( # attr_path operator
+        r'\.*\s*' + Node.PATTERN + r'(?:\s*\.+\s*' + Node.PATTERN + r')*\s*'
+        + OPERATOR_PATTERN)
+
+    _match_target        :'Callable' = REGEX_TARGET.match # bound once
+    _match_quoted_target :'Callable' = REGEX_QUOTED_TARGET.match
+
+    __slots__ = ()
 
     attr_path :Path
     operator  :str
@@ -415,66 +721,109 @@ class MatchAttrPredicate(Predicate):
         return f'<MatchAttr {self.attr_path} {self.operator} {self.target}>'
 
     def parse(self, text:str,
-              full:bool=True)->int:
+              full:bool=True, pos:int=0)->int:
+        start = pos
         self.attr_path = Path(seperator='.')
-        pos = self.attr_path.parse(text, full=False)
-        text_ = text[pos:].lstrip()
-        if not text_:
-            raise YPathSyntaxError(MatchAttrPredicate, text, 'operator expected', len(text))
-
-        for operator, func in MatchAttrPredicate.OPERATORS.items():
-            if text_.startswith(operator):
-                self.operator = operator
-                self.func = func
-                text_ = text_[len(operator):].lstrip()
-                break
-        else:
+        pos = self.attr_path.parse(text, full=False, pos=pos)
+        self._get = self.attr_path.getter()
+        pos = REGEX_SPACES.match(text, pos).end()
+        if pos == len(text):
             raise YPathSyntaxError(
-                MatchAttrPredicate, text, 'invalid operator', len(text) - len(text_))
-
-        if not text_:
-            raise YPathSyntaxError(MatchAttrPredicate, text, 'target expected', len(text))
-
-        if text_[0] in '"\'':
-            quote = text_[0]
-            escaped = False
-            pos += 1
-            for pos in range(1, len(text_)):
-                if escaped:
-                    escaped = False
-                    continue
-                char = text_[pos]
-                if char == '\\':
-                    escaped = True
-                elif char == quote:
-                    quote = None
-                    pos += 1
-                    break
-            if quote:
-                raise YPathSyntaxError(MatchAttrPredicate, text, 'trailing target', len(text))
+                MatchAttrPredicate, text[start:], 'operator expected', len(text) - start)
+
+        # HINT: looked up by the 2 characters head first, then the 1 character one
+        operators = MatchAttrPredicate.OPERATORS
+        op = text[pos:pos + 2]
+        func = operators.get(op)
+        if func is None:
+            op = text[pos]
+            func = operators.get(op)
+            if func is None:
+                raise YPathSyntaxError(
+                    MatchAttrPredicate, text[start:], 'invalid operator', pos - start)
+
+        self.operator = op
+        self.func = func
+        pos = REGEX_SPACES.match(text, pos + len(op)).end()
+
+        if pos == len(text):
+            raise YPathSyntaxError(
+                MatchAttrPredicate, text[start:], 'target expected', len(text) - start)
+
+        if text[pos] in '"\'':
+            m = MatchAttrPredicate._match_quoted_target(text, pos)
+            if not m:
+                raise YPathSyntaxError(
+                    MatchAttrPredicate, text[start:], 'trailing target', len(text) - start)
 
-            target = text_[:pos]
-            text_ = text_[pos:]
+            target = m.group()
+            pos = m.end()
         else:
-            m = MatchAttrPredicate.REGEX_TARGET.match(text_)
+            m = MatchAttrPredicate._match_target(text, pos)
             if not m:
                 raise YPathSyntaxError(
-                    MatchAttrPredicate, text, 'invalid target', len(text) - len(text_))
+                    MatchAttrPredicate, text[start:], 'invalid target', pos - start)
 
             target = m.group()
-            text_ = text_[m.end():]
+            pos = m.end()
 
-        self.target = load_prototxt(target)
-        return len(text) - len(text_)
+        self.target = _decode_literal(target)
+        MatchAttrPredicate._specialize(self) # HINT: not swapped to the subclass yet
+        return pos
 
     def match(self, mapping:'Mapping[str, Any]')->bool:
         try:
-            item = self.attr_path.access(mapping)
+            item = self._get(mapping)
         except (LookupError, TypeError):
             return False
         else:
             return self.func(item, self.target)
 
+    def matcher(self)->'Callable[[Mapping[str, Any]], bool]':
+        return self._test
+
+    def _specialize(self):
+        r"""generate '_test' like 'match', with the operator inlined, the getter and target bound"""
+
+        source = '\n'.join([
+            'def match(mapping):',
+            '    try:',
+            '        item = get(mapping)',
+            '    except (LookupError, TypeError):',
+            '        return False',
+            '    return ' + MatchAttrPredicate.EXPRESSIONS[self.operator].format(
+                item='item', target='target'),
+        ])
+        namespace = dict(get=self._get, target=self.target)
+        exec(_compile_source(source), namespace)
+        self._test = namespace['match']
+
+
+# HINT: up to the next predicate delimiter / end, with quoted strings skipped
+REGEX_PREDICATE_EXTENT :'re.Pattern' = re.compile(
+    r'(?:[^"\'|)]|"(?:[^"\\]|\\.)*"|\'(?:[^\'\\]|\\.)*\')*', re.DOTALL)
+
+
+# NOTE: predicates are shared once parsed, they are not modified by matching
+@lru_cache(maxsize=1024)
+def _parse_predicate_source(source:str)->'Tuple[Predicate, int]':
+    r"""parse a 'Predicate' partially from its own source, cached with the end position"""
+
+    predicate = Predicate()
+    return predicate, predicate.parse(source, full=False)
+
+
+def _parse_predicate(text:str, pos:int)->'Tuple[Predicate, int]':
+    r"""parse a 'Predicate' partially from text[pos:], returns it with the end position"""
+
+    end = REGEX_PREDICATE_EXTENT.match(text, pos).end()
+    try:
+        predicate, length = _parse_predicate_source(text[pos:end])
+    except YPathSyntaxError: # reported on the full text
+        predicate = Predicate()
+        return predicate, predicate.parse(text, full=False, pos=pos)
+    return predicate, pos + length
+
 
 # Predicate registries
 Predicate.subclasses.extend([MatchAttrPredicate, HasAttrPredicate])
@@ -549,10 +898,10 @@ if __name__ == '__main__':
         else:
             raise AssertionError('unexpected success')
 
-    path = YPath()
-    path.parse('/{/proxy/node(x==1), node(x>=1)}')
+    path = compile('/{/proxy/node(x==1), node(x>=1)}')
     print(path.collect({'proxy': {'node': {'x': 1}}, 'node': {'x': 2}}))
 
+    path = YPath() # compiled paths are shared, not for re-parsing
     for text in ('/a/', 'a/b{x,y/z}'):
         try:
             path.parse(text)